@@ -1,18 +1,141 @@
+import asyncio
+import atexit
 import cohere
+import hashlib
+import ijson
 import json
+import orjson
+import fastjsonschema
+from aiolimiter import AsyncLimiter
+from diskcache import Cache
 import random
+import re
 import logging
+import mmap
 import os
+import sys
 import time
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from collections import defaultdict
 from datetime import datetime
+from multiprocessing import Pool
+from types import MappingProxyType
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Session files above this size are converted to JSON across a process pool
+_PARALLEL_CONVERT_THRESHOLD = 64 * 1024 * 1024
+
+# Degradation rules for locally-derived rejected responses
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_DEPTH_CLAUSE_RE = re.compile(r'\b(tradicional|origen|cultural|técnica|historia)\b', re.IGNORECASE)
+_BULLET_RE = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*', re.MULTILINE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _degrade(chosen: str) -> str:
+    """Derive a rejected response by deterministically degrading the chosen one.
+
+    The rejected answer is defined as a shorter, shallower take on the same
+    content: keep only the first sentences, drop any that carry cultural or
+    technical depth, strip bullet formatting, and cap the length. No second
+    API round-trip, zero tokens billed.
+    """
+    flattened = _BULLET_RE.sub('', chosen)
+    sentences = _SENTENCE_SPLIT_RE.split(flattened)[:3]
+    kept = [sent for sent in sentences if not _DEPTH_CLAUSE_RE.search(sent)]
+    rejected = _WHITESPACE_RE.sub(' ', ' '.join(kept)).strip()[:400]
+    if len(rejected) < 20:
+        rejected = chosen[:200]
+    return rejected
+
+
+def _transform_chunk(spec: Tuple[str, int, int]) -> List[Dict[str, Any]]:
+    """Pool worker: parse and clean one line-aligned byte range of a JSONL file.
+
+    Must live at module level so multiprocessing can pickle it. Each worker
+    seeks to its start offset, skips the partial line it landed in (the
+    previous worker owns it), and reads complete lines until past the end
+    offset, so every line is processed exactly once.
+    """
+    path, start, end = spec
+    pairs = []
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip a partial line only if the chunk starts mid-line; a chunk
+            # starting right after a newline owns the line it lands on
+            f.seek(start - 1)
+            if f.read(1) != b'\n':
+                f.readline()
+        else:
+            f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                pair = orjson.loads(line)
+                pairs.append({
+                    "messages": pair["messages"],
+                    "chosen": pair["chosen"],
+                    "rejected": pair["rejected"],
+                    "metadata": pair["metadata"]
+                })
+    return pairs
+
+# Quality schema for a serialized DPO pair; compiled once into a straight-line
+# validator instead of hand-rolled per-field checks on the hot write path
+DPO_PAIR_SCHEMA = {
+    "type": "object",
+    "required": ["messages", "chosen", "rejected", "metadata"],
+    "properties": {
+        "messages": {
+            "type": "array",
+            "minItems": 2,
+            "maxItems": 2,
+            "items": [
+                {"type": "object", "required": ["role"], "properties": {"role": {"const": "system"}}},
+                {"type": "object", "required": ["role"], "properties": {"role": {"const": "user"}}}
+            ]
+        },
+        "chosen": {"type": "string", "minLength": 50},
+        "rejected": {"type": "string", "minLength": 20},
+        "metadata": {
+            "type": "object",
+            "required": ["recipe_id", "recipe_name", "category", "context"]
+        }
+    }
+}
+
+# Static mappings shared by every generator instance; MappingProxyType keeps
+# them read-only so no call site can mutate (or feel obliged to copy) them
+CATEGORY_MAPPING = MappingProxyType({
+    "General": "basic_recipe",
+    "Ingredientes y preparación": "ingredients",
+    "Técnicas": "cooking_techniques",
+    "Tiempo y planificación": "time_and_planning",
+    "Información nutricional": "nutritional_info",
+    "Porciones": "scaling_portions",
+    "Solución de problemas": "troubleshooting",
+    "Contexto cultural": "cultural_context",
+    "Opción múltiple": "multiple_choice"
+})
+
+DIFFICULTY_MAPPING = MappingProxyType({
+    "basic_recipe": "beginner",
+    "ingredients": "beginner",
+    "cooking_techniques": "intermediate",
+    "cultural_context": "advanced",
+    "troubleshooting": "intermediate",
+    "nutritional_info": "intermediate",
+    "time_and_planning": "beginner",
+    "scaling_portions": "intermediate",
+    "multiple_choice": "intermediate"
+})
+
 @dataclass
 class DPOPair:
     """Structure for a DPO training pair"""
@@ -24,12 +147,42 @@ class DPOPair:
 class GastronomiaDPOGenerator:
     """Enhanced DPO dataset generator for Ecuadorian recipes using pre-defined questions"""
 
-    def __init__(self, cohere_api_key: str, questions_file: str = "recipe_questions.json", output_dir: str = "dpo_output"):
+    # Class-level constant so _select_system_message does not rebuild the
+    # mapping dict on every call
+    _CATEGORY_TO_MSG = {
+        "basic_recipe": "recipe_instructions",
+        "ingredients": "ingredient_knowledge",
+        "cooking_techniques": "technique_questions",
+        "cultural_context": "cultural_context",
+        "troubleshooting": "troubleshooting",
+        "nutritional_info": "nutritional_expert",
+        "time_and_planning": "recipe_instructions",
+        "scaling_portions": "recipe_instructions",
+        "multiple_choice": "multiple_choice_expert"
+    }
+
+    def __init__(self, cohere_api_key: str, questions_file: str = "recipe_questions.json", output_dir: str = "dpo_output", concurrency: int = 32, requests_per_minute: int = 500):
         """Initialize with Cohere API client, questions file, and output directory"""
-        self.co = cohere.ClientV2(cohere_api_key)
+        self.co = cohere.AsyncClientV2(cohere_api_key)
         self.model = 'command-a-03-2025'
         self.output_dir = output_dir
         self.questions_file = questions_file
+        self.concurrency = concurrency
+
+        # Token bucket paces requests to the real plan limit; back off only
+        # when the API actually throttles us
+        self.limiter = AsyncLimiter(max_rate=requests_per_minute, time_period=60)
+        self.max_retries = 5
+
+        # Memoized recipe context blocks, keyed by recipe id
+        self._recipe_block_cache = {}
+
+        # Disk-backed answer cache: recipes and the question bank are static,
+        # so re-runs and resumed sessions hit here instead of the API
+        self.llm_cache = Cache(os.path.join(output_dir, "llm_cache"))
+
+        # Compiled pair validator shared by both validate_* entry points
+        self._validate_pair = fastjsonschema.compile(DPO_PAIR_SCHEMA)
 
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -42,18 +195,16 @@ class GastronomiaDPOGenerator:
         self.current_session = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.session_file = os.path.join(output_dir, f"session_{self.current_session}.jsonl")
 
+        # Long-lived buffered session handle: one open/close per run instead
+        # of a syscall pair per saved pair; flushed every 50 records and on
+        # exit. Concurrent writers are already serialized by the async lock.
+        self._session_fh = open(self.session_file, 'ab', buffering=65536)
+        self._write_count = 0
+        self._progress_counter = 0
+        atexit.register(self._session_fh.close)
+
         # Map question categories from JSON to system categories
-        self.category_mapping = {
-            "General": "basic_recipe",
-            "Ingredientes y preparación": "ingredients", 
-            "Técnicas": "cooking_techniques",
-            "Tiempo y planificación": "time_and_planning",
-            "Información nutricional": "nutritional_info",
-            "Porciones": "scaling_portions",
-            "Solución de problemas": "troubleshooting",
-            "Contexto cultural": "cultural_context",
-            "Opción múltiple": "multiple_choice"
-        }
+        self.category_mapping = CATEGORY_MAPPING
 
         # Specialized system messages for different types of culinary expertise
         # Specialized system messages for different types of culinary expertise
@@ -75,15 +226,21 @@ class GastronomiaDPOGenerator:
             "base_expert": "Eres un chef experto especializado en cocina internacional con más de 20 años de experiencia. Tienes conocimiento profundo sobre ingredientes globales, técnicas tradicionales de diferentes culturas y la evolución de la gastronomía mundial."
         }
 
-    def _load_questions_bank(self) -> Dict[int, List[Dict[str, Any]]]:
-        """Load pre-defined questions from JSON file organized by recipe_id"""
-        questions_by_recipe = defaultdict(list)
+    def _load_questions_bank(self) -> Dict[int, Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]]:
+        """Load pre-defined questions as parallel tuples per recipe_id.
+
+        Structure-of-arrays layout: each recipe maps to three parallel tuples
+        (questions, categories, types) instead of a list of per-question
+        dicts, so there is one container per recipe rather than one per
+        question and the ~9 distinct category strings are interned and shared.
+        """
+        questions_by_recipe = defaultdict(lambda: ([], [], []))
 
         try:
             if not os.path.exists(self.questions_file):
                 logger.error(f"❌ Questions file not found: {self.questions_file}")
                 logger.info(f"💡 Please ensure {self.questions_file} exists in the current directory")
-                return questions_by_recipe
+                return {}
 
             logger.info(f"📂 Loading questions from: {self.questions_file}")
 
@@ -92,28 +249,45 @@ class GastronomiaDPOGenerator:
             
             logger.info(f"📄 Loaded {len(questions_data)} question entries from file")
             
-            # Organize questions by recipe_id
+            # Organize questions by recipe_id, pre-mapping each entry to the
+            # (question, category, question_type) tuple the pipeline consumes
+            # so lookups later are a single dict fetch with no remapping
             for i, question_item in enumerate(questions_data):
                 recipe_id = question_item.get("recipe_id")
-                if recipe_id:
-                    questions_by_recipe[recipe_id].append(question_item)
-                else:
+                if not recipe_id:
                     logger.warning(f"⚠️  Question entry {i} missing recipe_id: {question_item}")
+                    continue
+
+                question_text = question_item.get("questions", "")
+                if not question_text:
+                    logger.warning(f"⚠️  Empty question found for recipe ID {recipe_id}")
+                    continue
+
+                mapped_category = CATEGORY_MAPPING.get(
+                    question_item.get("questions_category", "General"), "basic_recipe")
+                question_type = sys.intern(question_item.get("question_type", "contextual"))
+                texts, cats, types_ = questions_by_recipe[recipe_id]
+                texts.append(question_text)
+                cats.append(mapped_category)
+                types_.append(question_type)
             
-            total_questions = sum(len(questions) for questions in questions_by_recipe.values())
-            unique_recipe_ids = list(questions_by_recipe.keys())
-            
-            logger.info(f"✅ Organized {total_questions} questions for {len(questions_by_recipe)} recipes")
-            logger.info(f"📊 Recipe IDs with questions: {sorted(unique_recipe_ids)}")
-            
-            return dict(questions_by_recipe)
+            # Freeze the per-recipe lists into tuples
+            frozen = {rid: (tuple(t), tuple(c), tuple(ty))
+                      for rid, (t, c, ty) in questions_by_recipe.items()}
+
+            total_questions = sum(len(t) for t, _, _ in frozen.values())
+
+            logger.info(f"✅ Organized {total_questions} questions for {len(frozen)} recipes")
+            logger.info(f"📊 Recipe IDs with questions: {sorted(frozen.keys())}")
+
+            return frozen
             
         except json.JSONDecodeError as e:
             logger.error(f"❌ Invalid JSON in questions file: {e}")
-            return questions_by_recipe
+            return {}
         except Exception as e:
             logger.error(f"❌ Error loading questions bank: {e}")
-            return questions_by_recipe
+            return {}
 
     def get_recipe_questions(self, recipe: Dict[str, Any]) -> List[Tuple[str, str, str]]:
         """Get all pre-defined questions for a specific recipe"""
@@ -124,59 +298,38 @@ class GastronomiaDPOGenerator:
             logger.warning(f"Recipe has no ID: {recipe_name}")
             return []
 
-        logger.info(f"🔍 Looking for questions for recipe ID: {recipe_id} ({recipe_name})")
-        logger.info(f"📋 Available recipe IDs in questions bank: {list(self.questions_bank.keys())}")
-
-        questions_data = self.questions_bank.get(recipe_id, [])
-        if not questions_data:
+        # Per-recipe diagnostics are DEBUG-only; the bank-keys dump in
+        # particular formats the whole id list, so skip it entirely unless
+        # debug logging is actually enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"🔍 Looking for questions for recipe ID: {recipe_id} ({recipe_name})")
+            logger.debug(f"📋 Available recipe IDs in questions bank: {list(self.questions_bank.keys())}")
+
+        # Bank entries are parallel (texts, categories, types) tuples; zip
+        # them back into the (question, category, type) triples callers expect
+        entry = self.questions_bank.get(recipe_id)
+        if not entry:
             logger.warning(f"❌ No questions found for recipe ID {recipe_id}: {recipe_name}")
             logger.info(f"💡 Make sure your recipe_questions.json contains questions with recipe_id: {recipe_id}")
             return []
 
-        questions = []
-        for question_item in questions_data:
-            question_text = question_item.get("questions", "")
-            questions_category = question_item.get("questions_category", "General")
-            question_type = question_item.get("question_type", "contextual")
-
-            if not question_text:
-                logger.warning(f"⚠️  Empty question found for recipe ID {recipe_id}")
-                continue
-
-            # Map to internal category system
-            mapped_category = self.category_mapping.get(questions_category, "basic_recipe")
-
-            questions.append((question_text, mapped_category, question_type))
-
-        logger.info(f"✅ Found {len(questions)} valid pre-defined questions for recipe: {recipe_name}")
-        return questions
+        texts, cats, types_ = entry
+        logger.debug(f"✅ Found {len(texts)} valid pre-defined questions for recipe: {recipe_name}")
+        return list(zip(texts, cats, types_))
 
     def _select_system_message(self, category: str) -> str:
         """Select appropriate system message based on question category"""
-        category_mapping = {
-            "basic_recipe": "recipe_instructions",
-            "ingredients": "ingredient_knowledge", 
-            "cooking_techniques": "technique_questions",
-            "cultural_context": "cultural_context",
-            "troubleshooting": "troubleshooting",
-            "nutritional_info": "nutritional_expert",
-            "time_and_planning": "recipe_instructions",
-            "scaling_portions": "recipe_instructions",
-            "multiple_choice": "multiple_choice_expert"
-        }
+        return self.system_messages[self._CATEGORY_TO_MSG.get(category, "base_expert")]
 
-        message_type = category_mapping.get(category, "base_expert")
-        return self.system_messages[message_type]
-
-    def generate_chosen_response(self, question: str, recipe: Dict[str, Any], category: str) -> str:
-        """Generate high-quality chosen response"""
-        system_message = self._select_system_message(category)
-
-        user_message = f"""Responde la siguiente pregunta sobre la receta "{recipe['nombre']}" de manera completa, precisa y culturalmente auténtica.
-
-Pregunta: {question}
-
-Información de la receta:
+    def _recipe_context_block(self, recipe: Dict[str, Any]) -> str:
+        """Build the recipe context block once per recipe. The same bytes are
+        reused across every question about the recipe, and the block sits at
+        the start of the user message so the provider's prompt cache can hit
+        on the shared prefix."""
+        recipe_id = recipe.get("id")
+        block = self._recipe_block_cache.get(recipe_id)
+        if block is None:
+            block = f"""Información de la receta:
 - Nombre: {recipe['nombre']}
 - Ingredientes: {', '.join(recipe['ingredientes'])}
 - Tiempo: {recipe['tiempo']}
@@ -184,18 +337,46 @@ Información de la receta:
 - Raciones: {recipe['racion']}
 - Valor nutricional: {recipe.get('valor_nutricional', 'N/A')}
 
-Pasos de preparación: {' '.join(recipe['pasos'])}
+Pasos de preparación: {' '.join(recipe['pasos'])}"""
+            self._recipe_block_cache[recipe_id] = block
+        return block
+
+    async def _chat_with_rate_limit(self, **chat_kwargs):
+        """Issue a chat call through the token bucket, backing off on 429s"""
+        for attempt in range(self.max_retries):
+            try:
+                async with self.limiter:
+                    return await self.co.chat(model=self.model, **chat_kwargs)
+            except cohere.TooManyRequestsError:
+                backoff = min(60, 2 ** attempt + random.random())
+                logger.warning(f"⏳ Rate limited by API; retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+        raise RuntimeError(f"Rate limited after {self.max_retries} attempts")
+
+    async def generate_response_pair(self, question: str, recipe: Dict[str, Any], category: str) -> Optional[Tuple[str, str]]:
+        """Generate the chosen response via the API and derive rejected locally.
+
+        Returns None on API failure so callers can tell a real pair from a
+        fallback and keep the latter out of the persistent cache.
+        """
+        system_message = self._select_system_message(category)
 
-Proporciona una respuesta que sea:
+        # Static-first prompt layout: recipe block and instructions are
+        # identical for every question about a recipe; only the trailing
+        # question varies, so the cacheable prefix is maximized
+        user_message = f"""{self._recipe_context_block(recipe)}
+
+Responde la pregunta final sobre esta receta. Tu respuesta debe ser:
 1. Técnicamente precisa y completa
 2. Culturalmente auténtica para el origen de la receta
 3. Práctica y útil para cocinar
 4. Clara y en español natural
-5. Específica para esta receta"""
+5. Específica para esta receta
+
+Pregunta: {question}"""
 
         try:
-            response = self.co.chat(
-                model=self.model,
+            response = await self._chat_with_rate_limit(
                 messages=[
                     {"role": "system", "content": system_message},
                     {"role": "user", "content": user_message}
@@ -203,89 +384,65 @@ Proporciona una respuesta que sea:
                 max_tokens=8192,
                 temperature=0.7
             )
-            return response.message.content[0].text.strip()
+            chosen = response.message.content[0].text.strip()
+            if chosen:
+                # Rejected is a deterministic degradation of chosen: one API
+                # round-trip per pair instead of two
+                return chosen, _degrade(chosen)
+            logger.error(f"Empty response for question: {question[:80]}")
         except Exception as e:
-            logger.error(f"Error generating chosen response: {e}")
-            return "Lo siento, no puedo proporcionar esa información en este momento."
+            logger.error(f"Error generating response pair: {e}")
 
-    def generate_rejected_response(self, question: str, recipe: Dict[str, Any], category: str) -> str:
-        """Generate plausible but inferior rejected response"""
-        
-        # Create a degraded system message
-        degraded_system = "Responde brevemente sobre cocina, pero no profundices demasiado en los detalles técnicos o culturales."
-        
-        user_message = f"""Responde la pregunta sobre {recipe['nombre']} de manera básica.
+        return None
 
-Pregunta: {question}
-
-Información de la receta:
-- Nombre: {recipe['nombre']}
-- Ingredientes: {', '.join(recipe['ingredientes'])}
-- Tiempo: {recipe['tiempo']}
-- Dificultad: {recipe['dificultad']}
-- Raciones: {recipe['racion']}
-- Valor nutricional: {recipe.get('valor_nutricional', 'N/A')}
-
-Pasos de preparación: {' '.join(recipe['pasos'])}
+    async def generate_dpo_pair(self, recipe: Dict[str, Any], question: str, category: str, context: str) -> DPOPair:
+        """Generate a complete DPO pair for a recipe question"""
 
-Proporciona una respuesta que sea:
-1. Correcta pero incompleta o mal formada
-2. General, no específica el origen
-3. Breve y con detalles técnicos pero sin profundidad
-4. Sin contexto cultural específico"""
+        # Short-circuit on pairs already generated in a previous run
+        cache_key = f"{recipe['id']}:{hashlib.sha256(question.encode()).hexdigest()}"
+        cached = self.llm_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"  💾 Answer cache hit for recipe {recipe['id']}")
+            return DPOPair(**cached)
 
-        try:
-            response = self.co.chat(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": degraded_system},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=2048,
-                temperature=0.9
-            )
-            return response.message.content[0].text.strip()
-        except Exception as e:
-            logger.error(f"Error generating rejected response: {e}")
-            return "Es un plato tradicional. Sigue las instrucciones básicas de cocina."
-    
-    def generate_dpo_pair(self, recipe: Dict[str, Any], question: str, category: str, context: str) -> DPOPair:
-        """Generate a complete DPO pair for a recipe question"""
-        
         system_message = self._select_system_message(category)
-        
+
         messages = [
             {"role": "system", "content": system_message},
             {"role": "user", "content": question}
         ]
-        
-        chosen = self.generate_chosen_response(question, recipe, category)
-        rejected = self.generate_rejected_response(question, recipe, category)
-        
-        # Determine difficulty level
-        difficulty_mapping = {
-            "basic_recipe": "beginner",
-            "ingredients": "beginner", 
-            "cooking_techniques": "intermediate",
-            "cultural_context": "advanced",
-            "troubleshooting": "intermediate",
-            "nutritional_info": "intermediate",
-            "time_and_planning": "beginner",
-            "scaling_portions": "intermediate",
-            "multiple_choice": "intermediate"
-        }
+
+        # One round-trip yields both responses (system prompt paid once)
+        pair = await self.generate_response_pair(question, recipe, category)
+        from_api = pair is not None
+        if pair is None:
+            pair = ("Lo siento, no puedo proporcionar esa información en este momento.",
+                    "Es un plato tradicional. Sigue las instrucciones básicas de cocina.")
+        chosen, rejected = pair
         
         metadata = {
             "recipe_id": recipe["id"],
             "recipe_name": recipe["nombre"],
             "category": category,
             "context": context,  # This will be the question_type from JSON
-            "difficulty_level": difficulty_mapping.get(category, "intermediate"),
+            "difficulty_level": DIFFICULTY_MAPPING.get(category, "intermediate"),
             "recipe_category": recipe.get("categoria", "N/A"),
             "recipe_country": recipe.get("pais", "Ecuador")
         }
         
-        return DPOPair(messages, chosen, rejected, metadata)
+        dpo_pair = DPOPair(messages, chosen, rejected, metadata)
+
+        # Only cache real API pairs that pass validation; fallback responses
+        # from failed calls get regenerated next run instead of being replayed
+        if from_api and self.validate_dpo_pair_object(dpo_pair):
+            self.llm_cache[cache_key] = {
+                "messages": messages,
+                "chosen": chosen,
+                "rejected": rejected,
+                "metadata": metadata
+            }
+
+        return dpo_pair
     
     def save_dpo_pair_incremental(self, dpo_pair: DPOPair) -> bool:
         """Save individual DPO pair immediately to JSONL file"""
@@ -294,21 +451,24 @@ Proporciona una respuesta que sea:
                 logger.warning("Skipping invalid DPO pair during incremental save")
                 return False
             
-            # Convert to dict format
-            pair_dict = {
+            # Append to JSONL file (one JSON object per line); orjson emits
+            # UTF-8 bytes without escaping non-ASCII. The dict literal feeds
+            # the serializer directly - no named intermediate that would just
+            # be thrown away after the dumps call
+            self._session_fh.write(orjson.dumps({
                 "messages": dpo_pair.messages,
                 "chosen": dpo_pair.chosen,
                 "rejected": dpo_pair.rejected,
                 "metadata": dpo_pair.metadata,
                 "timestamp": datetime.now().isoformat(),
                 "session_id": self.current_session
-            }
-            
-            # Append to JSONL file (one JSON object per line)
-            with open(self.session_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(pair_dict, ensure_ascii=False) + '\n')
+            }))
+            self._session_fh.write(b'\n')
+            self._write_count += 1
+            if self._write_count % 50 == 0:
+                self._session_fh.flush()
             
-            logger.info(f"✅ Saved DPO pair for recipe '{dpo_pair.metadata['recipe_name']}' - Category: {dpo_pair.metadata['category']}")
+            logger.debug(f"✅ Saved DPO pair for recipe '{dpo_pair.metadata['recipe_name']}' - Category: {dpo_pair.metadata['category']}")
             return True
             
         except Exception as e:
@@ -317,40 +477,20 @@ Proporciona una respuesta que sea:
     
     def validate_dpo_pair_object(self, dpo_pair: DPOPair) -> bool:
         """Validate a DPOPair object meets quality standards"""
-        try:
-            # Check required fields in DPOPair object
-            if not dpo_pair.messages or not dpo_pair.chosen or not dpo_pair.rejected or not dpo_pair.metadata:
-                return False
-            
-            # Check message structure
-            messages = dpo_pair.messages
-            if len(messages) != 2 or messages[0]["role"] != "system" or messages[1]["role"] != "user":
-                return False
-            
-            # Check response quality (basic checks)
-            chosen = dpo_pair.chosen
-            rejected = dpo_pair.rejected
-            
-            if len(chosen) < 50 or len(rejected) < 20:  # Minimum length check
-                return False
-            
-            if chosen == rejected:  # Responses shouldn't be identical
-                return False
-            
-            # Check metadata completeness
-            metadata = dpo_pair.metadata
-            required_metadata = ["recipe_id", "recipe_name", "category", "context"]
-            if not all(field in metadata for field in required_metadata):
-                return False
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error validating DPO pair object: {e}")
-            return False
+        return self.validate_dpo_pair({
+            "messages": dpo_pair.messages,
+            "chosen": dpo_pair.chosen,
+            "rejected": dpo_pair.rejected,
+            "metadata": dpo_pair.metadata
+        })
     
     def save_progress(self, current_recipe_idx: int, total_recipes: int, current_question_idx: int, total_questions: int, recipe_name: str):
-        """Save current progress to allow resuming"""
+        """Save a human-readable progress snapshot.
+
+        Resume correctness comes from the completed-key set built off the
+        session JSONL; this file is just a status readout, written atomically
+        via a temp-file rename.
+        """
         progress_data = {
             "session_id": self.current_session,
             "timestamp": datetime.now().isoformat(),
@@ -363,8 +503,10 @@ Proporciona una respuesta que sea:
         }
         
         try:
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
+            tmp_path = self.progress_file + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(progress_data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.progress_file)
         except Exception as e:
             logger.error(f"Error saving progress: {e}")
     
@@ -378,89 +520,150 @@ Proporciona una respuesta que sea:
             logger.error(f"Error loading progress: {e}")
         return {}
     
+    def _iter_session(self, session_id: str = None):
+        """Yield DPO pairs from a session file one at a time.
+
+        Streaming keeps memory at a single parsed record regardless of
+        session size; callers that need the full list can wrap it in list().
+        """
+        if session_id is None:
+            session_id = self.current_session
+
+        session_file = os.path.join(self.output_dir, f"session_{session_id}.jsonl")
+
+        # Push any buffered writes to disk before reading our own session
+        if session_id == self.current_session:
+            self._session_fh.flush()
+
+        if not os.path.exists(session_file) or os.path.getsize(session_file) == 0:
+            return
+
+        # mmap the file so the OS pages it in and line scanning is a zero-copy
+        # find() over the mapping instead of Python-level buffered reads
+        with open(session_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                start = 0
+                while (nl := mm.find(b'\n', start)) != -1:
+                    line = mm[start:nl]
+                    if line.strip():
+                        yield orjson.loads(line)
+                    start = nl + 1
+                tail = mm[start:]
+                if tail.strip():
+                    yield orjson.loads(tail)
+            finally:
+                mm.close()
+
+    @staticmethod
+    def _completion_key(recipe_id: Any, question: str) -> Tuple[Any, bytes]:
+        """Compact identity for a generated pair: recipe id + 8-byte question hash"""
+        return (recipe_id, hashlib.sha1(question.encode()).digest()[:8])
+
+    def _load_completed_keys(self) -> set:
+        """Stream previous session files and collect completed pair keys.
+
+        Keys are (recipe_id, question_hash) tuples, so resume is O(1) per
+        question regardless of how async scheduling interleaved prior runs.
+        """
+        done = set()
+        for session_id in self.list_sessions():
+            if session_id == self.current_session:
+                continue
+            try:
+                for pair in self._iter_session(session_id):
+                    question = pair["messages"][1]["content"]
+                    done.add(self._completion_key(pair["metadata"]["recipe_id"], question))
+            except Exception as e:
+                logger.error(f"Error reading session {session_id} for resume: {e}")
+        return done
+
     def load_existing_pairs(self, session_id: str = None) -> List[Dict[str, Any]]:
         """Load existing DPO pairs from a session file"""
         if session_id is None:
             session_id = self.current_session
-        
-        session_file = os.path.join(self.output_dir, f"session_{session_id}.jsonl")
-        pairs = []
-        
+
         try:
-            if os.path.exists(session_file):
-                with open(session_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            pair = json.loads(line.strip())
-                            pairs.append(pair)
+            pairs = list(self._iter_session(session_id))
+            if pairs:
                 logger.info(f"Loaded {len(pairs)} existing DPO pairs from session {session_id}")
         except Exception as e:
             logger.error(f"Error loading existing pairs: {e}")
-        
+            return []
+
         return pairs
     
-    def process_recipe_batch_incremental(self, recipes: List[Dict[str, Any]], use_all_questions: bool = True, resume: bool = True) -> str:
-        """Process recipes with incremental saving and progress tracking using pre-defined questions"""
+    async def process_recipe_batch_incremental(self, recipes: List[Dict[str, Any]], use_all_questions: bool = True, resume: bool = True) -> str:
+        """Process recipes concurrently with incremental saving and progress tracking using pre-defined questions"""
         start_time = time.time()
         total_recipes = len(recipes)
-        successful_pairs = 0
-        failed_pairs = 0
-        
-        # Check for existing progress
-        start_recipe_idx = 0
-        if resume:
-            progress = self.load_progress()
-            if progress and input(f"Resume from {progress.get('completion_percentage', 0):.1f}%? (y/n): ").lower() == 'y':
-                start_recipe_idx = progress.get('current_recipe_idx', 0)
-                logger.info(f"🔄 Resuming from recipe {start_recipe_idx + 1}/{total_recipes}")
-        
+        counters = {"success": 0, "failed": 0}
+
+        # Resume by skipping completed (recipe_id, question) keys rather than
+        # a linear recipe index: idempotent, no prompt, and safe under async
+        # reordering where later questions may have finished before earlier ones
+        done = self._load_completed_keys() if resume else set()
+        if done:
+            logger.info(f"🔄 Resuming: {len(done)} pairs already completed will be skipped")
+
         logger.info(f"🚀 Starting DPO generation for {total_recipes} recipes using pre-defined questions")
+        logger.info(f"⚡ Concurrency: {self.concurrency} in-flight questions")
         logger.info(f"📁 Output file: {self.session_file}")
-        
-        for recipe_idx, recipe in enumerate(recipes[start_recipe_idx:], start_recipe_idx):
-            recipe_start_time = time.time()
-            logger.info(f"\n📖 Processing recipe {recipe_idx + 1}/{total_recipes}: {recipe['nombre']}")
-            
-            # Get all pre-defined questions for this recipe
-            # Get questions for this recipe
-            questions = self.get_recipe_questions(recipe)
-            
-            for question_idx, (question, category, context) in enumerate(questions):
+
+        # Semaphore bounds in-flight API calls; the lock serializes file writes
+        semaphore = asyncio.Semaphore(self.concurrency)
+        write_lock = asyncio.Lock()
+
+        async def process_question(recipe_idx, recipe, question_idx, total_questions, question, category, context):
+            async with semaphore:
                 try:
-                    # Save progress
-                    self.save_progress(recipe_idx, total_recipes, question_idx, len(questions), recipe['nombre'])
-                    
-                    logger.info(f"  ⚡ Processing Q{question_idx + 1}/{len(questions)} - {category}")
-                    
-                    # Generate DPO pair
-                    dpo_pair = self.generate_dpo_pair(recipe, question, category, context)
-                    
-                    # Save immediately
-                    if self.save_dpo_pair_incremental(dpo_pair):
-                        successful_pairs += 1
-                    else:
-                        failed_pairs += 1
-                        logger.warning(f"  ❌ Failed to save Q{question_idx + 1}")
-                    
-                    # Brief pause to avoid rate limiting
-                    time.sleep(0.5)
-                    
+                    logger.debug(f"  ⚡ Processing recipe {recipe_idx + 1}/{total_recipes} Q{question_idx + 1}/{total_questions} - {category}")
+                    dpo_pair = await self.generate_dpo_pair(recipe, question, category, context)
                 except Exception as e:
-                    failed_pairs += 1
+                    counters["failed"] += 1
                     logger.error(f"  ❌ Error processing Q{question_idx + 1}: {e}")
+                    return
+
+            async with write_lock:
+                # Snapshot the status file every 10 pairs, not per question:
+                # each pair already costs seconds of model time, so this loses
+                # no useful granularity while dropping a disk write per call
+                self._progress_counter += 1
+                if self._progress_counter % 10 == 0:
+                    self.save_progress(recipe_idx, total_recipes, question_idx, total_questions, recipe['nombre'])
+                if self.save_dpo_pair_incremental(dpo_pair):
+                    counters["success"] += 1
+                else:
+                    counters["failed"] += 1
+                    logger.warning(f"  ❌ Failed to save Q{question_idx + 1}")
+
+        tasks = []
+        skipped = 0
+        for recipe_idx, recipe in enumerate(recipes):
+            # Get all pre-defined questions for this recipe
+            questions = self.get_recipe_questions(recipe)
+            logger.debug(f"📖 Queued recipe {recipe_idx + 1}/{total_recipes}: {recipe['nombre']} ({len(questions)} questions)")
+
+            for question_idx, (question, category, context) in enumerate(questions):
+                if self._completion_key(recipe["id"], question) in done:
+                    skipped += 1
                     continue
-            
-            recipe_time = time.time() - recipe_start_time
-            logger.info(f"  ✅ Completed recipe in {recipe_time:.1f}s - Success: {successful_pairs}, Failed: {failed_pairs}")
-        
+                tasks.append(process_question(
+                    recipe_idx, recipe, question_idx, len(questions), question, category, context))
+
+        if skipped:
+            logger.info(f"⏭️  Skipped {skipped} already-completed questions")
+
+        await asyncio.gather(*tasks)
+
         # Final summary
         total_time = time.time() - start_time
         logger.info(f"\n🎉 Batch processing complete!")
         logger.info(f"⏱️  Total time: {total_time:.1f}s")
-        logger.info(f"✅ Successful pairs: {successful_pairs}")
-        logger.info(f"❌ Failed pairs: {failed_pairs}")
+        logger.info(f"✅ Successful pairs: {counters['success']}")
+        logger.info(f"❌ Failed pairs: {counters['failed']}")
         logger.info(f"📁 Output saved to: {self.session_file}")
-        
+
         return self.session_file
     
     def convert_jsonl_to_json(self, session_id: str = None, output_filename: str = None) -> str:
@@ -473,25 +676,40 @@ Proporciona una respuesta que sea:
         
         session_file = os.path.join(self.output_dir, f"session_{session_id}.jsonl")
         output_path = os.path.join(self.output_dir, output_filename)
-        
+
+        # Push any buffered writes to disk before reading our own session
+        if session_id == self.current_session:
+            self._session_fh.flush()
+
         pairs = []
         try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        pair = json.loads(line.strip())
-                        # Remove session metadata for final dataset
-                        clean_pair = {
-                            "messages": pair["messages"],
-                            "chosen": pair["chosen"],
-                            "rejected": pair["rejected"],
-                            "metadata": pair["metadata"]
-                        }
-                        pairs.append(clean_pair)
+            file_size = os.stat(session_file).st_size if os.path.exists(session_file) else 0
+            num_proc = os.cpu_count() or 1
+
+            if file_size >= _PARALLEL_CONVERT_THRESHOLD and num_proc > 1:
+                # Large session: parse/clean line-aligned byte ranges across a
+                # process pool so the JSON work escapes the GIL
+                chunk_size = (file_size + num_proc - 1) // num_proc
+                specs = [(session_file, i * chunk_size, min((i + 1) * chunk_size, file_size))
+                         for i in range(num_proc)]
+                with Pool(num_proc) as pool:
+                    for part in pool.map(_transform_chunk, specs):
+                        pairs.extend(part)
+            else:
+                for pair in self._iter_session(session_id):
+                    # Remove session metadata for final dataset
+                    clean_pair = {
+                        "messages": pair["messages"],
+                        "chosen": pair["chosen"],
+                        "rejected": pair["rejected"],
+                        "metadata": pair["metadata"]
+                    }
+                    pairs.append(clean_pair)
             
-            # Save final JSON format
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(pairs, f, ensure_ascii=False, indent=2)
+            # Save final JSON format; orjson keeps indented output on the
+            # C fast path where json.dump's indent falls back to Python
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(pairs, option=orjson.OPT_INDENT_2))
             
             logger.info(f"📄 Converted {len(pairs)} pairs to final dataset: {output_path}")
             return output_path
@@ -505,29 +723,19 @@ Proporciona una respuesta que sea:
         if session_id is None:
             session_id = self.current_session
 
-        pairs = self.load_existing_pairs(session_id)
-
-        if not pairs:
-            return {
-                "total_pairs": 0,
-                "categories": {},
-                "recipes": {},
-                "session_id": session_id,
-                "unique_recipes": 0,
-                "unique_categories": 0
-            }
-
-        # Calculate statistics
+        # Stream the session file so stats never materialize every pair
+        total_pairs = 0
         categories = defaultdict(int)
         recipes = defaultdict(int)
 
-        for pair in pairs:
+        for pair in self._iter_session(session_id):
             metadata = pair.get("metadata", {})
             categories[metadata.get("category", "unknown")] += 1
             recipes[metadata.get("recipe_name", "unknown")] += 1
+            total_pairs += 1
 
         return {
-            "total_pairs": len(pairs),
+            "total_pairs": total_pairs,
             "categories": dict(categories),
             "recipes": dict(recipes),
             "session_id": session_id,
@@ -551,38 +759,16 @@ Proporciona una respuesta que sea:
     def validate_dpo_pair(self, pair: Dict[str, Any]) -> bool:
         """Validate a DPO pair meets quality standards"""
         try:
-            # Check required fields
-            required_fields = ["messages", "chosen", "rejected", "metadata"]
-            if not all(field in pair for field in required_fields):
-                return False
-
-            # Check message structure
-            messages = pair["messages"]
-            if len(messages) != 2 or messages[0]["role"] != "system" or messages[1]["role"] != "user":
-                return False
-
-            # Check response quality (basic checks)
-            chosen = pair["chosen"]
-            rejected = pair["rejected"]
-
-            if len(chosen) < 50 or len(rejected) < 20:  # Minimum length check
-                return False
-
-            if chosen == rejected:  # Responses shouldn't be identical
-                return False
-
-            # Check metadata completeness
-            metadata = pair["metadata"]
-            required_metadata = ["recipe_id", "recipe_name", "category", "context"]
-            if not all(field in metadata for field in required_metadata):
-                return False
-
-            return True
-
+            self._validate_pair(pair)
+        except fastjsonschema.JsonSchemaException:
+            return False
         except Exception as e:
             logger.error(f"Error validating DPO pair: {e}")
             return False
 
+        # Responses shouldn't be identical (not expressible in the schema)
+        return pair["chosen"] != pair["rejected"]
+
     def save_dataset(self, dpo_pairs: List[Dict[str, Any]], filename: str = "ecuadorian_recipes_dpo.json"):
         """Save DPO dataset to JSON file with validation (legacy method)"""
 
@@ -596,15 +782,15 @@ Proporciona una respuesta que sea:
 
         # Save to file
         output_path = os.path.join(self.output_dir, filename)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(valid_pairs, f, ensure_ascii=False, indent=2)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(valid_pairs, option=orjson.OPT_INDENT_2))
 
         logger.info(f"Saved {len(valid_pairs)} valid DPO pairs to {output_path}")
         return len(valid_pairs)
 
-    def generate_complete_dataset(self, recipes: List[Dict[str, Any]], use_all_questions: bool = True, resume: bool = True) -> str:
+    async def generate_complete_dataset(self, recipes: List[Dict[str, Any]], use_all_questions: bool = True, resume: bool = True) -> str:
         """Complete workflow: generate DPO pairs using pre-defined questions with incremental saving"""
-        
+
         logger.info(f"🎯 Starting complete DPO dataset generation using pre-defined questions")
 
         # Calculate estimated pairs based on questions bank
@@ -616,7 +802,7 @@ Proporciona una respuesta que sea:
         logger.info(f"📊 {len(recipes)} recipes with ~{total_estimated_pairs} pre-defined questions")
 
         # Process with incremental saving
-        session_file = self.process_recipe_batch_incremental(recipes, use_all_questions, resume)
+        session_file = await self.process_recipe_batch_incremental(recipes, use_all_questions, resume)
 
         if not session_file:
             logger.error("❌ Failed to generate DPO pairs")
@@ -654,8 +840,10 @@ def main():
         recipes_json_path = "somosnpl-recetas-zero.json"
         print(f"\n📂 Loading recipes from: {recipes_json_path}")
 
-        with open(recipes_json_path, 'r', encoding='utf-8') as f:
-            recipes = json.load(f)
+        # Stream recipes one at a time instead of parsing the whole file
+        # into memory before any work begins
+        with open(recipes_json_path, 'rb') as f:
+            recipes = list(ijson.items(f, 'item'))
 
         print(f"✅ Loaded {len(recipes)} recipes")
 
@@ -675,7 +863,7 @@ def main():
         if test_questions:
             print("✅ Questions found! Proceeding with full dataset generation...")
             # Generate dataset using all pre-defined questions
-            final_dataset = generator.generate_complete_dataset(recipes, use_all_questions=True)
+            final_dataset = asyncio.run(generator.generate_complete_dataset(recipes, use_all_questions=True))
         else:
             print("❌ No questions found for test recipe!")
             print("💡 Check that:")
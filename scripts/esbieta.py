@@ -1,14 +1,16 @@
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
+import aiohttp
+import asyncio
+import io
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+import lxml.html
+from lxml import etree
+import orjson
 import re
 import logging
 import argparse
 import os
 from urllib.parse import urljoin
 import random
-from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
 
 # Setup logging
@@ -30,180 +32,211 @@ parser.add_argument('--max-recipes', type=int, default=None, help='Maximum numbe
 parser.add_argument('--threads', type=int, default=1, help='Number of threads to use')
 args = parser.parse_args()
 
-# Setup session with headers for requests
-session = requests.Session()
-session.headers.update({
+# Browser-like headers shared by every request
+HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
     'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, br',
     'Connection': 'keep-alive',
     'Upgrade-Insecure-Requests': '1',
-})
+}
 
-def get_recipe_links():
+# Transient statuses worth retrying with backoff
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+async def fetch(http, url, retries=3, backoff_factor=1.5):
+    """GET a URL over the shared session, retrying transient failures"""
+    for attempt in range(retries + 1):
+        async with http.get(url) as response:
+            if response.status in _RETRY_STATUSES and attempt < retries:
+                delay = backoff_factor * (2 ** attempt)
+                logging.warning(f"Got {response.status} for {url}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            return await response.read()
+
+
+# XPath expressions compiled once at import; evaluation then runs entirely in
+# C instead of walking the tree with Python-level find/find_all calls
+_LOWER = "translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZÁÉÍÓÚ', 'abcdefghijklmnopqrstuvwxyzáéíóú')"
+_XP_CONTENT = etree.XPath("//div[contains(@class, 'entry-content')]")
+_XP_TITLE = etree.XPath("//h1[contains(@class, 'entry-title')]")
+_XP_YT = etree.XPath("//iframe[contains(@src, 'youtube.com/embed')]/@src")
+_XP_ING_ITEMS = etree.XPath(
+    f".//*[self::h2 or self::h3 or self::h4 or self::strong or self::b]"
+    f"[contains({_LOWER}, 'ingrediente')]/following::ul[1]/li"
+)
+_XP_HEADERS = etree.XPath(".//*[self::h2 or self::h3 or self::h4 or self::strong or self::b]")
+_XP_PARAS = etree.XPath(".//p")
+_XP_FOLLOWING_OL = etree.XPath("following::ol[1]")
+_XP_FEATURED_IMG = etree.XPath("//div[contains(@class, 'featured-image')]//img/@src")
+_XP_OG_IMG = etree.XPath("//meta[@property='og:image']/@content")
+
+# Hoisted inner-loop constants: compiled once instead of per paragraph/page
+_SPLIT_ING = re.compile(r'[,\n]')
+_INSTR_MARKERS = ('preparación', 'elaboración', 'cómo hacer', 'procedimiento',
+                  'vamos', 'paso a paso', 'instrucciones')
+
+async def get_recipe_links(http):
     """Extract all recipe links from the alphabetical index page"""
     url = "https://www.recetasdesbieta.com/todas-las-recetas-por-orden-alfabetico/"
     
     try:
-        response = session.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find all recipe links
-        links = []
-        # In the website, recipe links appear directly in the content
-        content = soup.find('div', class_='entry-content')
-        
-        if content:
-            # Get all <a> tags that are direct recipe links
-            for a_tag in content.find_all('a'):
-                href = a_tag.get('href')
-                if href and 'recetasdesbieta.com' in href and not href.endswith('#comments'):
-                    links.append(href)
-                    logging.debug(f"Found recipe link: {href}")
-        
-        return links
+        body = await fetch(http, url)
+
+        # Stream anchor/div end events instead of building the whole index
+        # DOM; once the entry-content div closes, every content link has
+        # been seen and parsing stops
+        links = {}
+        context = etree.iterparse(io.BytesIO(body), events=('end',), tag=('a', 'div'), html=True)
+        for _, elem in context:
+            if elem.tag == 'div':
+                if 'entry-content' in (elem.get('class') or ''):
+                    break
+                continue
+
+            # Only keep anchors that sit inside the entry-content div
+            parent = elem.getparent()
+            while parent is not None:
+                if parent.tag == 'div' and 'entry-content' in (parent.get('class') or ''):
+                    href = elem.get('href')
+                    if href and 'recetasdesbieta.com' in href and not href.endswith('#comments'):
+                        # dict keys deduplicate while keeping first-seen order
+                        links[href] = None
+                        logging.debug(f"Found recipe link: {href}")
+                    break
+                parent = parent.getparent()
+            elem.clear(keep_tail=True)
+
+        return list(links)
     except Exception as e:
         logging.error(f"Error getting recipe links: {str(e)}")
         return []
 
-def extract_youtube_url(soup):
+def extract_youtube_url(tree):
     """Extract YouTube URL from the recipe page if available"""
     try:
-        # Find iframe with YouTube embed
-        iframe = soup.find('iframe', src=lambda s: s and 'youtube.com/embed' in s)
-        if iframe and 'src' in iframe.attrs:
-            return iframe['src']
-        return ""
+        srcs = _XP_YT(tree)
+        return srcs[0] if srcs else ""
     except Exception as e:
         logging.error(f"Error extracting YouTube URL: {str(e)}")
         return ""
 
-def extract_ingredients(soup):
+def extract_ingredients(tree):
     """Extract ingredients list from the recipe page"""
     try:
+        # Preferred format: a <ul> following an "Ingredientes" header
+        items = _XP_ING_ITEMS(tree)
+        if items:
+            return [li.text_content().strip() for li in items if li.text_content().strip()]
+
+        # Sometimes ingredients are in paragraphs
         ingredients = []
-        # Try to find ingredients in different formats
-        
-        # Look for ingredient paragraphs - often they appear after bold text that says "Ingredientes"
-        ingredient_section = None
-        for h2 in soup.find_all(['h2', 'h3', 'h4', 'strong', 'b']):
-            if 'ingrediente' in h2.text.lower():
-                ingredient_section = h2.find_next('ul')
-                break
-        
-        # If we found a list of ingredients
-        if ingredient_section and ingredient_section.find_all('li'):
-            for li in ingredient_section.find_all('li'):
-                ingredients.append(li.text.strip())
-        else:
-            # Sometimes ingredients are in paragraphs
-            content = soup.find('div', class_='entry-content')
-            if content:
-                # Try to identify the ingredients section
-                paragraphs = content.find_all('p')
-                for i, p in enumerate(paragraphs):
-                    text = p.text.strip().lower()
-                    if ('ingrediente' in text or 'necesita' in text) and i + 1 < len(paragraphs):
-                        # The next paragraph might contain ingredients
-                        ingredient_text = paragraphs[i + 1].text.strip()
-                        # Split by commas or line breaks
-                        for item in re.split(r'[,\n]', ingredient_text):
-                            if item.strip() and not item.strip().startswith('http'):
-                                ingredients.append(item.strip())
-        
+        content = _XP_CONTENT(tree)
+        if content:
+            # Try to identify the ingredients section
+            paragraphs = _XP_PARAS(content[0])
+            for i, p in enumerate(paragraphs):
+                text = p.text_content().strip().lower()
+                if ('ingrediente' in text or 'necesita' in text) and i + 1 < len(paragraphs):
+                    # The next paragraph might contain ingredients
+                    ingredient_text = paragraphs[i + 1].text_content().strip()
+                    # Split by commas or line breaks
+                    for item in _SPLIT_ING.split(ingredient_text):
+                        if item.strip() and not item.strip().startswith('http'):
+                            ingredients.append(item.strip())
+
         return ingredients
     except Exception as e:
         logging.error(f"Error extracting ingredients: {str(e)}")
         return []
 
-def extract_instructions(soup):
+def extract_instructions(tree):
     """Extract cooking instructions from the recipe page"""
     try:
         instructions = ""
-        content = soup.find('div', class_='entry-content')
-        
+        content = _XP_CONTENT(tree)
+
         if not content:
             return instructions
-            
-        # Instructions typically start after ingredients
-        # Look for common headers that indicate the start of instructions
-        instruction_markers = ['preparación', 'elaboración', 'cómo hacer', 'procedimiento', 
-                              'vamos', 'paso a paso', 'instrucciones']
-        
-        # First try to find the instructions section by headers
+        content = content[0]
+
+        # First try to find the instructions section by headers; markers
+        # indicating the start of instructions are hoisted to module scope
         found = False
-        for header in content.find_all(['h2', 'h3', 'h4', 'strong', 'b']):
-            header_text = header.text.lower()
-            
-            if any(marker in header_text for marker in instruction_markers):
+        for header in _XP_HEADERS(content):
+            header_text = header.text_content().lower()
+
+            if any(marker in header_text for marker in _INSTR_MARKERS):
                 # Found the start of instructions
-                instructions_elem = header.find_next('ol')
-                if instructions_elem:
+                following_ol = _XP_FOLLOWING_OL(header)
+                if following_ol:
                     # If we found an ordered list, use that
-                    steps = []
-                    for li in instructions_elem.find_all('li'):
-                        steps.append(li.text.strip())
+                    steps = [li.text_content().strip() for li in following_ol[0].iter('li')]
                     instructions = "\n".join(steps)
                     found = True
                     break
                 else:
                     # Otherwise, collect paragraphs that follow
                     steps = []
-                    for elem in header.next_siblings:
-                        if elem.name == 'p':
-                            paragraph_text = elem.text.strip()
+                    for elem in header.itersiblings():
+                        if elem.tag == 'p':
+                            paragraph_text = elem.text_content().strip()
                             if paragraph_text:
                                 steps.append(paragraph_text)
-                        elif elem.name in ['h2', 'h3', 'h4', 'div', 'section']:
+                        elif elem.tag in ('h2', 'h3', 'h4', 'div', 'section'):
                             # Stop when we hit another header or div
                             break
-                    
+
                     instructions = "\n".join(steps)
                     found = True
                     break
-        
+
         # If we didn't find instructions by headers, try to extract from paragraphs
         if not found:
             # Get all paragraphs
-            paragraphs = content.find_all('p')
-            
+            paragraphs = _XP_PARAS(content)
+
             # Skip early paragraphs (typically intro and ingredients)
             start_idx = min(2, len(paragraphs) // 3)
-            
+
             # Collect middle paragraphs as instructions
             end_idx = max(start_idx + 1, len(paragraphs) - 2)
             instruction_paragraphs = paragraphs[start_idx:end_idx]
-            
-            instructions = "\n".join(p.text.strip() for p in instruction_paragraphs)
-        
+
+            instructions = "\n".join(p.text_content().strip() for p in instruction_paragraphs)
+
         return instructions
     except Exception as e:
         logging.error(f"Error extracting instructions: {str(e)}")
         return ""
 
-def extract_main_image(soup, url):
+def extract_main_image(tree, url):
     """Extract the main image of the recipe"""
     try:
         # First try to find the featured image
-        featured_img = soup.find('div', class_='featured-image')
-        if featured_img and featured_img.find('img') and featured_img.find('img').get('src'):
-            return featured_img.find('img')['src']
-        
+        featured = _XP_FEATURED_IMG(tree)
+        if featured:
+            return featured[0]
+
         # Second, try to find the first image in the content
-        content = soup.find('div', class_='entry-content')
-        if content and content.find('img') and content.find('img').get('src'):
-            img_src = content.find('img')['src']
-            # Make sure it's an absolute URL
-            if not img_src.startswith('http'):
-                img_src = urljoin(url, img_src)
-            return img_src
-        
+        content = _XP_CONTENT(tree)
+        if content:
+            srcs = content[0].xpath('.//img/@src')
+            if srcs:
+                img_src = srcs[0]
+                # Make sure it's an absolute URL
+                if not img_src.startswith('http'):
+                    img_src = urljoin(url, img_src)
+                return img_src
+
         # Try meta image
-        meta_img = soup.find('meta', property='og:image')
-        if meta_img and meta_img.get('content'):
-            return meta_img['content']
-            
+        meta_img = _XP_OG_IMG(tree)
+        if meta_img:
+            return meta_img[0]
+
         return ""
     except Exception as e:
         logging.error(f"Error extracting main image: {str(e)}")
@@ -231,33 +264,31 @@ def extract_youtube_transcript(youtube_url):
         logging.error(f"Error extracting YouTube transcript: {str(e)}")
         return ""
 
-def scrape_recipe(url):
+async def scrape_recipe(http, url):
     """Scrape a single recipe page"""
     try:
         logging.info(f"Scraping recipe: {url}")
         
-        # Add a delay to avoid hammering the server
-        time.sleep(args.delay + random.uniform(0, 1))
-        
-        response = session.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Add a jittered delay to avoid hammering the server
+        await asyncio.sleep(args.delay + random.uniform(0, 1))
         
+        body = await fetch(http, url)
+        tree = lxml.html.fromstring(body)
+
         # Extract all required information
-        title = soup.find('h1', class_='entry-title').text.strip() if soup.find('h1', class_='entry-title') else "Unknown Title"
-        image_url = extract_main_image(soup, url)
-        youtube_url = extract_youtube_url(soup)
-        ingredients = extract_ingredients(soup)
-        instructions = extract_instructions(soup)
-        
-        # Get full content 
-        content_div = soup.find('div', class_='entry-content')
-        full_content = content_div.text.strip() if content_div else ""
-        
+        title_elems = _XP_TITLE(tree)
+        title = title_elems[0].text_content().strip() if title_elems else "Unknown Title"
+        image_url = extract_main_image(tree, url)
+        youtube_url = extract_youtube_url(tree)
+        ingredients = extract_ingredients(tree)
+        instructions = extract_instructions(tree)
+
         # Get YouTube transcript (if available)
         youtube_transcript = extract_youtube_transcript(youtube_url) if youtube_url else ""
         
-        # Return recipe data
+        # Return recipe data. full_content is deliberately omitted: it
+        # duplicated the text already captured in ingredients/instructions
+        # and inflated the output JSON severalfold for downstream loaders.
         return {
             "title": title,
             "url": url,
@@ -265,7 +296,6 @@ def scrape_recipe(url):
             "youtube_url": youtube_url,
             "ingredients": ingredients,
             "instructions": instructions,
-            "full_content": full_content,
             "youtube_transcript": youtube_transcript
         }
     except Exception as e:
@@ -278,8 +308,8 @@ def load_existing_recipes(filename):
         return []
         
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filename, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         logging.error(f"Error loading existing recipes: {str(e)}")
         return []
@@ -287,68 +317,64 @@ def load_existing_recipes(filename):
 def save_recipes(recipes, filename):
     """Save recipes data to a JSON file"""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(recipes, f, ensure_ascii=False, indent=2)
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(recipes, option=orjson.OPT_INDENT_2))
         logging.info(f"Saved {len(recipes)} recipes to {filename}")
     except Exception as e:
         logging.error(f"Error saving recipes: {str(e)}")
 
-def main():
+async def main():
     """Main function to orchestrate the scraping process"""
     logging.info("Starting recipe scraper")
-    
-    # Get all recipe links
-    all_links = get_recipe_links()
-    logging.info(f"Found {len(all_links)} recipe links")
-    
-    # Limit the number of recipes if requested
-    if args.max_recipes:
-        all_links = all_links[:args.max_recipes]
-        logging.info(f"Limited to {len(all_links)} recipes as requested")
-    
-    # Load existing data if resuming
-    recipes = load_existing_recipes(args.output)
-    logging.info(f"Loaded {len(recipes)} existing recipes")
-    
-    # Create a set of already scraped URLs for quick lookup
-    scraped_urls = {recipe['url'] for recipe in recipes}
-    
-    # Filter out already scraped recipes
-    links_to_scrape = [link for link in all_links[args.start_index:] if link not in scraped_urls]
-    logging.info(f"Remaining recipes to scrape: {len(links_to_scrape)}")
-    
-    if not links_to_scrape:
-        logging.info("No new recipes to scrape. Exiting.")
-        return
-    
-    # Scrape recipes
-    if args.threads > 1:
-        # Use ThreadPoolExecutor for parallel scraping
-        logging.info(f"Scraping with {args.threads} threads")
-        with ThreadPoolExecutor(max_workers=args.threads) as executor:
-            new_recipes = list(executor.map(scrape_recipe, links_to_scrape))
+
+    # One keep-alive connection pool for the whole run: TCP/TLS setup is
+    # paid per host, not per request. The pool is sized to the requested
+    # concurrency so workers above the default limit don't silently
+    # serialize. Responses are cached in SQLite for a day (404s included,
+    # so dead URLs aren't refetched), making re-runs near-instant.
+    connector = aiohttp.TCPConnector(limit=max(1, args.threads), keepalive_timeout=75)
+    cache = SQLiteBackend('esbieta_cache', expire_after=86400, allowed_codes=(200, 404))
+    semaphore = asyncio.Semaphore(max(1, args.threads))
+
+    async with CachedSession(cache=cache, connector=connector, headers=HEADERS) as http:
+        # Get all recipe links
+        all_links = await get_recipe_links(http)
+        logging.info(f"Found {len(all_links)} recipe links")
         
-        # Filter out None values (failed scrapes)
-        new_recipes = [r for r in new_recipes if r]
-        recipes.extend(new_recipes)
-    else:
-        # Scrape sequentially
-        for i, link in enumerate(links_to_scrape):
-            logging.info(f"Scraping recipe {i+1}/{len(links_to_scrape)}: {link}")
-            
-            # Scrape the recipe
-            recipe_data = scrape_recipe(link)
-            
-            if recipe_data:
-                recipes.append(recipe_data)
-                
-                # Save incrementally every 10 recipes
-                if (i + 1) % 10 == 0:
-                    save_recipes(recipes, args.output)
+        # Limit the number of recipes if requested
+        if args.max_recipes:
+            all_links = all_links[:args.max_recipes]
+            logging.info(f"Limited to {len(all_links)} recipes as requested")
+        
+        # Load existing data if resuming
+        recipes = load_existing_recipes(args.output)
+        logging.info(f"Loaded {len(recipes)} existing recipes")
+        
+        # Membership test on 64-bit URL hashes instead of full strings:
+        # halves set memory and makes the filter loop integer comparisons
+        scraped_hashes = frozenset(hash(recipe['url']) for recipe in recipes)
+        
+        # Filter out already scraped recipes
+        links_to_scrape = [link for link in all_links[args.start_index:] if hash(link) not in scraped_hashes]
+        logging.info(f"Remaining recipes to scrape: {len(links_to_scrape)}")
+        
+        if not links_to_scrape:
+            logging.info("No new recipes to scrape. Exiting.")
+            return
+
+        async def sem_scrape(url):
+            async with semaphore:
+                return await scrape_recipe(http, url)
+
+        logging.info(f"Scraping with up to {args.threads} concurrent requests")
+        new_recipes = await asyncio.gather(*[sem_scrape(url) for url in links_to_scrape])
+
+    # Filter out None values (failed scrapes)
+    recipes.extend(r for r in new_recipes if r)
     
     # Final save
     save_recipes(recipes, args.output)
     logging.info("Recipe scraping completed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""Convert an NDJSON transcript dump into a JSON array for downstream consumers.
+
+The transcript scraper appends one recipe per line; re-runs may append a
+recipe more than once, so the last occurrence of each url wins here.
+"""
+import sys
+
+import orjson
+
+
+def ndjson_to_json(input_file, output_file):
+    recipes = {}
+    with open(input_file, 'rb') as f:
+        for line in f:
+            if line.strip():
+                recipe = orjson.loads(line)
+                recipes[recipe.get('url')] = recipe
+
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(list(recipes.values()), option=orjson.OPT_INDENT_2))
+
+    print(f"Wrote {len(recipes)} recipes to {output_file}")
+
+
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'esbieta_recipes_with_transcripts.ndjson'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else 'esbieta_recipes_with_transcripts.json'
+    ndjson_to_json(input_file, output_file)
@@ -1,15 +1,25 @@
+import asyncio
 import json
+import orjson
 import cohere
-import time
+import ijson
+import re
 from typing import List, Dict, Any
 import os
 from datetime import datetime
 
+# Fence stripping and array extraction compiled once: one scan per response
+# instead of cascaded startswith/endswith slices and find/rfind passes
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.MULTILINE)
+_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
 class RecipeQuestionGenerator:
-    def __init__(self, cohere_api_key: str):
+    def __init__(self, cohere_api_key: str, concurrency: int = 8, batch_size: int = 4):
         """Initialize the generator with Cohere API key"""
-        self.co = cohere.ClientV2(cohere_api_key)
+        self.co = cohere.AsyncClientV2(cohere_api_key)
         self.model = 'command-a-03-2025'
+        self.concurrency = concurrency
+        self.batch_size = batch_size
         
     def enhanced_prompt(self, recipe_data: Dict[str, Any]) -> tuple:
         """Create an enhanced prompt for question generation with system and user messages"""
@@ -60,23 +70,8 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
     
     def clean_json_response(self, text: str) -> str:
         """Clean the API response to extract pure JSON"""
-        # Remove markdown code blocks if present
-        text = text.strip()
-        
-        # Remove ```json at the beginning
-        if text.startswith('```json'):
-            text = text[7:]  # Remove '```json'
-        elif text.startswith('```'):
-            text = text[3:]   # Remove '```'
-        
-        # Remove ``` at the end
-        if text.endswith('```'):
-            text = text[:-3]
-        
-        # Strip any remaining whitespace
-        text = text.strip()
-        
-        return text
+        # One regex pass removes any markdown fences, wherever they appear
+        return _FENCE_RE.sub('', text).strip()
     
     def fix_incomplete_json(self, questions_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Fix incomplete JSON objects by adding missing fields"""
@@ -97,12 +92,12 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
         
         return fixed_questions
     
-    def generate_questions_for_recipe(self, recipe_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def generate_questions_for_recipe(self, recipe_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Generate questions for a single recipe using Cohere API"""
         try:
             system_message, user_message = self.enhanced_prompt(recipe_data)
             
-            response = self.co.chat(
+            response = await self.co.chat(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_message},
@@ -135,12 +130,10 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
                 
                 # Try to extract partial JSON if possible
                 try:
-                    # Look for the first [ and last ] to extract the array
-                    start_idx = cleaned_text.find('[')
-                    end_idx = cleaned_text.rfind(']')
-                    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                        partial_json = cleaned_text[start_idx:end_idx+1]
-                        questions_data = json.loads(partial_json)
+                    # Extract the outermost array in one greedy match
+                    array_match = _ARRAY_RE.search(cleaned_text)
+                    if array_match:
+                        questions_data = json.loads(array_match.group(0))
                         if isinstance(questions_data, list):
                             questions_data = self.fix_incomplete_json(questions_data)
                             print(f"Successfully recovered {len(questions_data)} questions from partial JSON")
@@ -154,6 +147,100 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
             print(f"Error generating questions for recipe {recipe_data.get('id')}: {e}")
             return []
     
+    def batch_prompt(self, recipes: List[Dict[str, Any]]) -> tuple:
+        """Create a prompt covering several recipes in one request.
+
+        The ~500-token instruction block is billed once per batch instead of
+        once per recipe, and one round-trip covers batch_size recipes.
+        """
+        system_message = """Eres un experto chef instructor que debe crear un banco de preguntas educativas en español para ayudar a las personas a aprender a preparar recetas.
+
+INSTRUCCIONES PARA GENERAR PREGUNTAS:
+Para CADA receta listada, crea minimo 15 o mas preguntas necesarias que sirvan para que una persona pueda aprender la receta. Cada pregunta debe:
+1. Incluir el nombre de la receta en la formulación
+2. Ser educativa y práctica
+3. La primera pregunta en primera persona sobre pedir la receta puedes usar estos contextos: cocina informal, cocinar para invitados, cena familiar, cocina de fin de semana, comida rápida, ocasión especial, aprender a cocinar.
+4. Ayudar a entender técnicas, ingredientes, pasos, tips, porciones, tiempos y significado cultural.
+
+Haz que la pregunta suene natural y conversacional, como una persona real preguntaría. Varía la estructura de la pregunta y no siempre empieces con "¿Cómo...?" o "¿Cuál...?". Incluye el contexto naturalmente.
+
+FORMATO DE RESPUESTA:
+Responde ÚNICAMENTE con un array JSON válido. NO uses markdown, NO uses ```json, NO agregues explicaciones adicionales.
+Usa esta estructura exacta, un objeto por receta:
+[
+  {
+    "recipe_id": 1,
+    "questions": [
+      {
+        "question": "¿Pregunta aquí incluyendo el nombre de la receta?",
+        "category": "Ingredientes y preparación",
+        "question_type": "conceptual"
+      }
+    ]
+  }
+]
+
+IMPORTANTE: Responde SOLO con el JSON, sin texto adicional ni formato markdown."""
+
+        blocks = []
+        for recipe in recipes:
+            blocks.append(f"""---RECIPE {recipe.get('id', '')}---
+- Nombre: {recipe.get('nombre', '')}
+- Dificultad: {recipe.get('dificultad', '')}
+- Tiempo: {recipe.get('tiempo', '')}
+- Porciones: {recipe.get('racion', '')}
+- Categoría: {recipe.get('categoria', '')}
+- Ingredientes: {', '.join(recipe.get('ingredientes', []))}
+- Pasos: {' '.join(recipe.get('pasos', []))}""")
+
+        user_message = "\n\n".join(blocks) + f"\n\nGenera las preguntas para las {len(recipes)} recetas anteriores en formato JSON:"
+        return system_message, user_message
+
+    async def generate_questions_for_batch(self, recipes: List[Dict[str, Any]]) -> Dict[Any, List[Dict[str, Any]]]:
+        """Generate questions for several recipes with a single API call"""
+        try:
+            system_message, user_message = self.batch_prompt(recipes)
+
+            response = await self.co.chat(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": user_message}
+                ],
+                # Scale with batch size but stay under the model's 8k
+                # output-token ceiling, which rejects larger values outright
+                max_tokens=min(8192, 4096 * len(recipes)),
+                temperature=0.7
+            )
+
+            generated_text = response.message.content[0].text.strip()
+            cleaned_text = self.clean_json_response(generated_text)
+
+            try:
+                batch_data = json.loads(cleaned_text)
+            except json.JSONDecodeError:
+                # Recover the array body if the model wrapped it in text
+                array_match = _ARRAY_RE.search(cleaned_text)
+                if array_match is None:
+                    raise
+                batch_data = json.loads(array_match.group(0))
+
+            if not isinstance(batch_data, list):
+                print("Warning: Batch response is not a list")
+                return {}
+
+            questions_by_id = {}
+            for entry in batch_data:
+                if isinstance(entry, dict) and 'recipe_id' in entry:
+                    questions = self.fix_incomplete_json(entry.get('questions', []))
+                    questions_by_id[entry['recipe_id']] = questions
+            return questions_by_id
+
+        except Exception as e:
+            ids = [recipe.get('id') for recipe in recipes]
+            print(f"Error generating questions for batch {ids}: {e}")
+            return {}
+
     def format_output(self, recipe_data: Dict[str, Any], questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Format the output according to the specified structure"""
         formatted_questions = []
@@ -170,39 +257,96 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
         
         return formatted_questions
     
-    def process_recipes(self, input_file: str, output_file: str, delay_seconds: float = 1.0):
+    def _load_checkpoint(self, checkpoint_file: str) -> tuple:
+        """Load already-generated questions and their recipe ids from a JSONL checkpoint"""
+        questions = []
+        done_ids = set()
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        question = orjson.loads(line)
+                        questions.append(question)
+                        done_ids.add(question.get('recipe_id'))
+        return questions, done_ids
+
+    async def process_recipes(self, input_file: str, output_file: str, delay_seconds: float = 1.0):
         """Process all recipes from input file and save questions to output file"""
         try:
-            # Load recipes from JSON file
-            with open(input_file, 'r', encoding='utf-8') as f:
-                recipes = json.load(f)
-            
-            all_questions = []
-            total_recipes = len(recipes)
-            
-            print(f"Processing {total_recipes} recipes...")
-            
-            for i, recipe in enumerate(recipes, 1):
-                print(f"Processing recipe {i}/{total_recipes}: {recipe.get('nombre', 'Unknown')}")
-                
-                # Generate questions for this recipe
-                questions = self.generate_questions_for_recipe(recipe)
-                
-                if questions:
-                    # Format the output
+            print(f"Processing recipes from {input_file}...")
+
+            # Append-only JSONL checkpoint: each recipe's questions land on
+            # disk the moment they're generated (O(1) per recipe, crash-safe),
+            # and completed recipe_ids are skipped on restart
+            checkpoint_file = output_file + '.jsonl'
+            all_questions, done_ids = self._load_checkpoint(checkpoint_file)
+            if done_ids:
+                print(f"Resuming: {len(done_ids)} recipes already completed")
+
+            checkpoint_fh = open(checkpoint_file, 'ab')
+            write_lock = asyncio.Lock()
+
+            # Bounded concurrency: the semaphore caps in-flight API calls and
+            # the politeness delay is awaited inside it, so model latency
+            # overlaps across recipes instead of summing with the delay
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def _run(batch):
+                async with semaphore:
+                    names = ", ".join(recipe.get('nombre', 'Unknown') for recipe in batch)
+                    print(f"Processing batch of {len(batch)} recipes: {names}")
+                    questions_by_id = await self.generate_questions_for_batch(batch)
+                    await asyncio.sleep(delay_seconds)
+
+                batch_questions = []
+                for recipe in batch:
+                    questions = questions_by_id.get(recipe.get('id'), [])
+                    if not questions:
+                        print(f"No questions generated for recipe {recipe.get('id')}")
+                        continue
                     formatted_questions = self.format_output(recipe, questions)
-                    all_questions.extend(formatted_questions)
+                    batch_questions.extend(formatted_questions)
                     print(f"Generated {len(questions)} questions for recipe {recipe.get('id')}")
-                else:
-                    print(f"No questions generated for recipe {recipe.get('id')}")
-                
-                # Add delay to avoid hitting API rate limits
-                if i < total_recipes:
-                    time.sleep(delay_seconds)
+
+                if batch_questions:
+                    async with write_lock:
+                        for question in batch_questions:
+                            checkpoint_fh.write(orjson.dumps(question) + b'\n')
+                        checkpoint_fh.flush()
+                return batch_questions
+
+            # Stream recipes incrementally, grouping batch_size of them per
+            # API call so the shared instruction block is billed once per
+            # batch and one round-trip covers several recipes
+            tasks = []
+            skipped = 0
+            total = 0
+            batch = []
+            with open(input_file, 'rb') as f:
+                for recipe in ijson.items(f, 'item'):
+                    if recipe.get('id') in done_ids:
+                        skipped += 1
+                        continue
+                    total += 1
+                    batch.append(recipe)
+                    if len(batch) >= self.batch_size:
+                        tasks.append(asyncio.ensure_future(_run(batch)))
+                        batch = []
+            if batch:
+                tasks.append(asyncio.ensure_future(_run(batch)))
+
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                checkpoint_fh.close()
+            for recipe_questions in results:
+                all_questions.extend(recipe_questions)
+
+            print(f"Processed {total} recipes in {len(tasks)} batches ({skipped} resumed from checkpoint).")
             
             # Save all questions to output file
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(all_questions, f, ensure_ascii=False, indent=2)
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(all_questions, option=orjson.OPT_INDENT_2))
             
             print(f"\nCompleted! Generated {len(all_questions)} total questions.")
             print(f"Results saved to: {output_file}")
@@ -212,7 +356,7 @@ Genera las 15 preguntas para la receta "{recipe_name}" en formato JSON:"""
             
         except FileNotFoundError:
             print(f"Error: Input file '{input_file}' not found.")
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, ijson.JSONError):
             print(f"Error: Invalid JSON in input file '{input_file}'.")
         except Exception as e:
             print(f"Unexpected error: {e}")
@@ -262,7 +406,7 @@ def main():
     generator = RecipeQuestionGenerator(COHERE_API_KEY)
     
     # Process all recipes
-    generator.process_recipes(INPUT_FILE, OUTPUT_FILE, DELAY_BETWEEN_REQUESTS)
+    asyncio.run(generator.process_recipes(INPUT_FILE, OUTPUT_FILE, DELAY_BETWEEN_REQUESTS))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,8 @@
-import requests
+import os
+import requests_cache
 import re
 import json
+import orjson
 import time
 
 # Add User-Agent to mimic a browser
@@ -8,36 +10,74 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
+# Persistent response cache: re-runs replay yesterday's watch pages from
+# SQLite instead of refetching; 404s are cached too so dead URLs stop
+# costing a round-trip every run
+session = requests_cache.CachedSession(
+    'youtube_count_cache', backend='sqlite', expire_after=86400, allowable_codes=(200, 404))
+
+# One compiled alternation over bytes: the watch page is scanned once for
+# any of the like-count formats instead of up to five regex passes, and
+# skipping .text avoids decoding ~500KB of HTML per video
+_LIKE_RE = re.compile(
+    rb'"label":"([\d,]+) likes"'
+    rb'|"likeCount":"(\d+)"'
+    rb'|"likesText":"([\d,]+)"'
+    rb'|"likes":(\d+)'
+    rb'|like this video along with ([\d,]+)'
+)
+
+# Video-id extractor compiled once; covers embed, watch and short URLs
+_VIDEO_ID_RE = re.compile(r'(?:embed/|v=|youtu\.be/)([a-zA-Z0-9_-]+)')
+
+# Data API key; without it the script falls back to scraping watch pages
+YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', '')
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3/videos'
+
+def extract_video_id(youtube_url):
+    match = _VIDEO_ID_RE.search(youtube_url)
+    return match.group(1) if match else None
+
+def get_stats_batch(video_ids, api_key):
+    """Fetch like counts for up to 50 video ids per Data API request.
+
+    One videos.list call replaces 50 full watch-page downloads and the
+    regex cascade over each; returns {video_id: likes}.
+    """
+    stats = {}
+    for i in range(0, len(video_ids), 50):
+        chunk = video_ids[i:i + 50]
+        try:
+            response = session.get(YOUTUBE_API_URL, params={
+                'part': 'statistics',
+                'id': ','.join(chunk),
+                'key': api_key
+            })
+            response.raise_for_status()
+            for item in response.json().get('items', []):
+                likes = item.get('statistics', {}).get('likeCount', 0)
+                stats[item['id']] = int(likes)
+        except Exception as e:
+            print(f"Error fetching stats batch: {str(e)}")
+    return stats
+
 def getStats(youtube_url):
     try:
-        # Convert embed URL to watch URL
-        video_id_match = re.search(r'embed/([^?]+)', youtube_url)
-        if video_id_match:
-            video_id = video_id_match.group(1)
+        # Convert embed URL to watch URL via the shared compiled extractor
+        video_id = extract_video_id(youtube_url)
+        if video_id:
             watch_url = f"https://www.youtube.com/watch?v={video_id}"
         else:
             watch_url = youtube_url
 
         print(f"Fetching data for: {watch_url}")
-        page = requests.get(watch_url, headers=headers)
-        page_content = page.text
-
-        # Try different patterns to find like count
-        like_match = re.search(r'"label":"([\d,]+) likes"', page_content) or \
-                    re.search(r'"likeCount":"(\d+)"', page_content) or \
-                    re.search(r'"likesText":"([\d,]+)"', page_content) or \
-                    re.search(r'"likes":(\d+)', page_content)
-
-        if like_match:
-            likes = like_match.group(1).replace(',', '')
-            return int(likes)
-        else:
-            # Backup approach - try to find it in a different format
-            like_text_match = re.search(r'like this video along with ([\d,]+)', page_content)
-            if like_text_match:
-                likes = like_text_match.group(1).replace(',', '')
-                return int(likes)
-            return 0
+        page = session.get(watch_url, headers=headers)
+
+        match = _LIKE_RE.search(page.content)
+        if match:
+            likes = next(group for group in match.groups() if group is not None)
+            return int(likes.replace(b',', b''))
+        return 0
 
     except Exception as e:
         print(f"Error processing {youtube_url}: {str(e)}")
@@ -46,22 +86,35 @@ def getStats(youtube_url):
 # Function to load the JSON data
 def load_json_data(content_string):
     try:
-        # Try to load the JSON directly
-        data = json.loads(content_string)
+        # Try to load the JSON directly (orjson fast path)
+        return orjson.loads(content_string)
+    except orjson.JSONDecodeError:
+        pass
+
+    # Well-formed prefix followed by trailing garbage: raw_decode parses the
+    # prefix once instead of re-parsing the whole string after a repair
+    try:
+        data, _ = json.JSONDecoder().raw_decode(content_string.lstrip())
+        print("Recovered JSON prefix before trailing data")
         return data
     except json.JSONDecodeError:
-        # If it fails, try to repair it by checking if it's an incomplete array
-        if content_string.strip().startswith("[") and not content_string.strip().endswith("]"):
+        pass
+
+    # Truncated array: cut back to the last complete object and close it,
+    # rather than blindly appending "]" to a possibly mid-object tail
+    stripped = content_string.strip()
+    if stripped.startswith("[") and not stripped.endswith("]"):
+        last_obj_end = stripped.rfind("}")
+        if last_obj_end != -1:
             try:
-                repaired_content = content_string.strip() + "]"
-                data = json.loads(repaired_content)
+                data = orjson.loads(stripped[:last_obj_end + 1] + "]")
                 print("Fixed incomplete JSON array")
                 return data
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print("Could not repair JSON")
                 return None
-        print("Invalid JSON format")
-        return None
+    print("Invalid JSON format")
+    return None
 
 # Main function
 def main():
@@ -76,15 +129,36 @@ def main():
             return
 
         # Process each recipe
-        for recipe in data:
-            youtube_url = recipe.get('youtube_url')
-            if youtube_url:
-                print(f"Processing: {recipe['nombre']}")
-                likes = getStats(youtube_url)
-                recipe['votos'] = likes
-                print(f"Updated '{recipe['nombre']}' with {likes} likes")
-                # Add a small delay to avoid rate limiting
-                time.sleep(1.5)
+        if YOUTUBE_API_KEY:
+            # Batch path: collect every video id, fetch stats 50 at a time,
+            # then assign in one pass — no watch-page HTML, no per-video sleep
+            video_ids = []
+            for recipe in data:
+                youtube_url = recipe.get('youtube_url')
+                if youtube_url:
+                    video_id = extract_video_id(youtube_url)
+                    if video_id:
+                        video_ids.append(video_id)
+
+            stats = get_stats_batch(video_ids, YOUTUBE_API_KEY)
+            for recipe in data:
+                youtube_url = recipe.get('youtube_url')
+                if youtube_url:
+                    video_id = extract_video_id(youtube_url)
+                    likes = stats.get(video_id, 0)
+                    recipe['votos'] = likes
+                    print(f"Updated '{recipe['nombre']}' with {likes} likes")
+        else:
+            print("No YOUTUBE_API_KEY set; falling back to scraping watch pages")
+            for recipe in data:
+                youtube_url = recipe.get('youtube_url')
+                if youtube_url:
+                    print(f"Processing: {recipe['nombre']}")
+                    likes = getStats(youtube_url)
+                    recipe['votos'] = likes
+                    print(f"Updated '{recipe['nombre']}' with {likes} likes")
+                    # Add a small delay to avoid rate limiting
+                    time.sleep(1.5)
 
         # Save the updated JSON
         with open('updated_recipes.json', 'w', encoding='utf-8') as file: